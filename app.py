@@ -1,5 +1,4 @@
 import streamlit as st
-import tempfile
 import os
 import pymupdf as fitz
 
@@ -9,6 +8,54 @@ from layout_engine import generate_layout_debug_pdf
 
 st.set_page_config(page_title="Resume Layout Engine", layout="wide")
 
+
+@st.cache_resource
+def get_extractor():
+    """One HeaderExtractor (and its compiled pattern tables) shared across reruns and sessions."""
+    return HeaderExtractor()
+
+
+def render_first_page(doc):
+    """Renders page 0 of an open document to JPEG preview bytes."""
+    # No alpha channel + 1.5x zoom is plenty for an on-screen preview
+    pix = doc[0].get_pixmap(matrix=fitz.Matrix(1.5, 1.5), alpha=False)
+    img_bytes = pix.tobytes("jpeg", jpg_quality=80)
+    pix = None
+    fitz.TOOLS.store_shrink(100)  # Release MuPDF's cached render resources
+    return img_bytes
+
+
+@st.cache_data(show_spinner=False)
+def render_input_preview(pdf_bytes):
+    """
+    Renders the input preview on its own so it can be shown before the analysis finishes.
+    Cached on the file contents, so revisiting a sample never re-renders it.
+    """
+    with fitz.open(stream=pdf_bytes, filetype="pdf") as doc:
+        return render_first_page(doc)
+
+
+@st.cache_data(show_spinner=False)
+def run_pipeline(pdf_bytes):
+    """
+    Runs the full analysis for one PDF held in memory. Streamlit reruns the script on every
+    widget interaction, so results are cached on the (hashed) file contents.
+    """
+    # The analysis shares a single open of the PDF: extraction reads page 0 first, then the
+    # layout engine draws onto it and the output preview is rendered from the annotated
+    # page, so the debug PDF never has to be re-parsed
+    with fitz.open(stream=pdf_bytes, filetype="pdf") as doc:
+        # 1. Header Extraction
+        headers, body_size, avg_height = get_extractor().extract(doc)
+
+        # 2. Layout Engine
+        debug_pdf_bytes = generate_layout_debug_pdf(doc[0], headers, body_size, avg_height)
+
+        pix_out_img = render_first_page(doc) if debug_pdf_bytes else None
+
+    return headers, body_size, avg_height, debug_pdf_bytes, pix_out_img
+
+
 st.title("📄 Algorithmic Resume Layout Analyzer")
 st.markdown("**System Status:** `Active` | **Engine:** `v1.0.2` | **Mode:** `Geometric Parsing`")
 
@@ -81,51 +128,41 @@ with col2:
     st.markdown("🟦 **Cyan Section Block**")
 
     # Logic to handle processing based on mode
-    process_path = None
+    pdf_bytes = None
     
-    # CASE 1: User Uploaded a File
+    # CASE 1: User Uploaded a File (already in memory, no temp file needed)
     if uploaded_file:
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as tmp:
-            tmp.write(uploaded_file.getvalue())
-            process_path = tmp.name
+        pdf_bytes = uploaded_file.getvalue()
             
     # CASE 2: User Selected a Sample
     elif selected_sample_path:
-        process_path = selected_sample_path
+        with open(selected_sample_path, "rb") as f:
+            pdf_bytes = f.read()
 
     # Execution Block
-    if process_path:
+    if pdf_bytes:
         try:
-            # 1. Header Extraction
-            with st.spinner("Analyzing Font Styles..."):
-                extractor = HeaderExtractor()
-                headers, body_size, avg_height = extractor.extract(process_path)
-            
-            # 2. Layout Engine
-            with st.spinner("Calculating Geometry & Splits..."):
-                debug_pdf_bytes = generate_layout_debug_pdf(process_path, headers, body_size, avg_height)
-            
-            st.success(f"**Analysis Complete:** Detected Body Font Size: {body_size}pt")
+            # Reserve the status line above the previews; it is filled once the analysis is done
+            status = st.empty()
 
             # --- VISUALIZATION SECTION ---
             st.subheader("Layout Deconstruction")
             
             view_col1, view_col2 = st.columns(2)
             
+            # The input preview doesn't depend on the analysis, so show it straight away
             with view_col1:
                 st.markdown("#### 📄 Original Input")
-                with fitz.open(process_path) as doc_in:
-                    page_in = doc_in[0]
-                    pix_in = page_in.get_pixmap(matrix=fitz.Matrix(2, 2))
-                    st.image(pix_in.tobytes(), use_container_width=True)
+                st.image(render_input_preview(pdf_bytes), use_container_width=True)
 
             with view_col2:
                 st.markdown("#### 🤖 Algorithmic Output")
-                if debug_pdf_bytes:
-                    with fitz.open(stream=debug_pdf_bytes, filetype="pdf") as doc_out:
-                        page_out = doc_out[0]
-                        pix_out = page_out.get_pixmap(matrix=fitz.Matrix(2, 2))
-                        st.image(pix_out.tobytes(), use_container_width=True)
+                with st.spinner("Analyzing Font Styles & Calculating Geometry..."):
+                    headers, body_size, avg_height, debug_pdf_bytes, pix_out_img = run_pipeline(pdf_bytes)
+                if pix_out_img:
+                    st.image(pix_out_img, use_container_width=True)
+
+            status.success(f"**Analysis Complete:** Detected Body Font Size: {body_size}pt")
 
             # Download Button
             if debug_pdf_bytes:
@@ -138,10 +175,5 @@ with col2:
 
         except Exception as e:
             st.error(f"An error occurred: {e}")
-            
-        finally:
-            # Cleanup temp file ONLY if it was created from upload (not sample)
-            if mode == "Upload PDF" and process_path and os.path.exists(process_path):
-                os.remove(process_path)
     else:
         st.info("👈 Waiting for input... Upload a resume or select a sample to see the geometric engine in action.")
\ No newline at end of file
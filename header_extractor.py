@@ -1,6 +1,74 @@
 import pymupdf as fitz
+import logging
+import os
 import re
 from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from operator import itemgetter
+
+logger = logging.getLogger(__name__)
+
+# Below this page count, starting worker processes costs more than it saves. Shared with
+# layout_engine, which parallelizes its debug pages the same way.
+PARALLEL_MIN_PAGES = 8
+MAX_WORKERS = 4
+
+# Default "dict" flags minus image blocks: only text blocks are read, so skip building (and copying) image data
+TEXT_FLAGS = fitz.TEXTFLAGS_DICT & ~fitz.TEXT_PRESERVE_IMAGES
+
+# _clean_text drops everything that is neither a word character nor whitespace. For ASCII text
+# (nearly every line) that set is known up front, so a C-level translate replaces the regex
+_NON_WORD_RE = re.compile(r'[^\w\s]')
+_ASCII_NON_WORD_TABLE = str.maketrans("", "", "".join(c for c in map(chr, range(128)) if _NON_WORD_RE.match(c)))
+
+# Characters that mark a line as a list item when they open it (•, ‣, ◦, ⁃, ∙, '-', '*')
+_BULLET_CHARS = frozenset("\u2022\u2023\u25E6\u2043\u2219-*")
+
+
+def _most_common(values):
+    """Returns the modal value; ties go to the value seen first, as with Counter.most_common."""
+    return Counter(values).most_common(1)[0][0]
+
+
+def open_pdf(source):
+    """
+    Opens a PDF from a file path or from in-memory bytes. Worker processes each open their
+    own copy this way, since MuPDF documents can't be shared across processes.
+    """
+    if isinstance(source, (bytes, bytearray)):
+        return fitz.open(stream=source, filetype="pdf")
+    return fitz.open(source)
+
+
+def page_chunks(page_numbers):
+    """
+    Splits 'page_numbers' (a non-empty range or list) into contiguous, near-equal chunks,
+    one per worker process; fewer than two chunks means running in-process is no slower.
+    """
+    workers = min(os.cpu_count() or 1, MAX_WORKERS, len(page_numbers))
+    chunk_size = -(-len(page_numbers) // workers)  # Ceiling division
+    return [page_numbers[start:start + chunk_size] for start in range(0, len(page_numbers), chunk_size)]
+
+
+def _intern_font(fonts, name):
+    """
+    Returns the (font_id, is_bold) pair for a raw span font name from 'fonts', a table owned
+    by one extraction. A document only uses a handful of fonts, so each name is lowered and
+    scanned once, and the table is dropped with the extraction instead of growing forever.
+    """
+    meta = fonts.get(name)
+    if meta is None:
+        meta = fonts[name] = (len(fonts), "bold" in name.lower())
+    return meta
+
+
+def _extract_page_lines(pdf_source, page_numbers):
+    """Worker entry point: styled lines of 'page_numbers', one list per page."""
+    extractor = HeaderExtractor()
+    fonts = {}
+    with open_pdf(pdf_source) as doc:
+        return [extractor._get_lines_with_style(doc[i], fonts) for i in page_numbers]
+
 
 class HeaderExtractor:
     def __init__(self):
@@ -18,51 +86,89 @@ class HeaderExtractor:
         # --- Create a "Spaceless" Lookup Map ---
         self.SPACELESS_HEADERS = {h.replace(" ", ""): h for h in self.HEADER_PATTERNS}
 
+        # --- Precompiled Lookups (built once, reused for every line) ---
+        self.HEADER_SET = frozenset(self.HEADER_PATTERNS)
+        self.SPACELESS_SET = frozenset(self.SPACELESS_HEADERS)
+        # Single alternation that answers "does any pattern occur in the line?" in one scan
+        self.HEADER_RE = re.compile("|".join(re.escape(h) for h in self.HEADER_PATTERNS))
+
     def _clean_text(self, text):
         """Normalizes text by removing punctuation and converting to lowercase."""
-        return re.sub(r'[^\w\s]', '', text).lower().strip()
+        if text.isascii():
+            text = text.translate(_ASCII_NON_WORD_TABLE)
+        else:
+            text = _NON_WORD_RE.sub('', text)
+        return text.lower().strip()
 
-    def _get_lines_with_style(self, page):
-        """Extracts lines with font metadata."""
-        blocks = page.get_text("dict")["blocks"]
+    def _get_lines_with_style(self, page, fonts):
+        """Extracts lines with font metadata; font ids come from the extraction's 'fonts' table."""
+        blocks = page.get_text("dict", flags=TEXT_FLAGS)["blocks"]
         lines = []
 
         for block in blocks:
-            if "lines" not in block: continue
+            if block["type"] != 0: continue
+            block_height = block["bbox"][3] - block["bbox"][1]
             for line in block["lines"]:
-                line_text = ""
-                spans = []
+                # Single pass over the spans: text, size total, bold flag and first font together
+                span_texts = []
+                size_total = 0
+                is_bold = False
+                font_name = None
+                font_id = None
                 for span in line["spans"]:
                     if span["text"].strip():
-                        line_text += span["text"] + " "
-                        spans.append(span)
+                        span_texts.append(span["text"])
+                        size_total += span["size"]
+                        span_font_id, span_is_bold = _intern_font(fonts, span["font"])
+                        if font_name is None:
+                            font_name = span["font"]
+                            font_id = span_font_id
+                        if span_is_bold:
+                            is_bold = True
 
-                line_text = line_text.strip()
+                # One join instead of repeated '+=' concatenation
+                line_text = " ".join(span_texts).strip()
                 if not line_text: continue
                 
-                if spans:
-                    avg_size = sum(s["size"] for s in spans) / len(spans)
-                    is_bold = any("bold" in s["font"].lower() for s in spans)
-                    font_name = spans[0]["font"]
-                else:
-                    avg_size, is_bold, font_name = 0, False, "unknown"
-
-                is_bullet = bool(re.match(r'^[\u2022\u2023\u25E6\u2043\u2219\-*]', line_text))
+                avg_size = size_total / len(span_texts)
+
+                is_bullet = line_text[0] in _BULLET_CHARS
+                clean = self._clean_text(line_text)
                 
                 lines.append({
                     "text": line_text,
-                    "clean": self._clean_text(line_text),
+                    "clean": clean,
+                    # Derived forms of 'clean'/'size' that extract() reads, computed once here
+                    "spaceless": clean.replace(" ", ""),
+                    "word_count": len(clean.split()),
                     "size": avg_size,
+                    "size_r": round(avg_size, 1),
                     "is_bold": is_bold,
                     "is_upper": line_text.isupper() and len(line_text) > 3,
                     "is_bullet": is_bullet,
                     "y": line["bbox"][1],
                     "font": font_name,
-                    "block_height": block["bbox"][3] - block["bbox"][1]
+                    "font_id": font_id,
+                    "block_height": block_height
                 })
-        lines.sort(key=lambda x: x["y"])
+        lines.sort(key=itemgetter("y"))
         return lines
 
+    def _get_lines_parallel(self, pdf_source, page_count, fonts):
+        """Extracts styled lines from contiguous page ranges in worker processes, in page order."""
+        chunks = page_chunks(range(page_count))
+
+        all_lines = []
+        with ProcessPoolExecutor(max_workers=len(chunks)) as ex:
+            for chunk_lines in ex.map(_extract_page_lines, [pdf_source] * len(chunks), chunks):
+                for page_lines in chunk_lines:
+                    all_lines.extend(page_lines)
+
+        # Font ids are assigned per worker, so re-intern the workers' fonts in this extraction's table
+        for line in all_lines:
+            line["font_id"] = _intern_font(fonts, line["font"])[0]
+        return all_lines
+
     def _merge_split_headers(self, lines):
         """Merges adjacent lines with same style ."""
         merged_lines = []
@@ -80,11 +186,13 @@ class HeaderExtractor:
                     # Check regular match OR spaceless match for the merged line
                     combined_spaceless = combined_clean.replace(" ", "")
                     
-                    if any(combined_clean == h for h in self.HEADER_PATTERNS) or \
-                       (combined_spaceless in self.SPACELESS_HEADERS):
+                    if (combined_clean in self.HEADER_SET) or \
+                       (combined_spaceless in self.SPACELESS_SET):
                         
                         current["text"] = current["text"] + " " + next_line["text"]
                         current["clean"] = combined_clean
+                        current["spaceless"] = combined_spaceless
+                        current["word_count"] += next_line["word_count"]
                         merged_lines.append(current)
                         i += 2
                         continue
@@ -92,103 +200,116 @@ class HeaderExtractor:
             i += 1
         return merged_lines
 
-    def extract(self, pdf_path):
-        doc = fitz.open(pdf_path)
-        all_lines = []
-        for page in doc:
-            all_lines.extend(self._get_lines_with_style(page))
+    def extract(self, pdf):
+        """Accepts a file path, the PDF's bytes, or an already-open fitz.Document (which is left open)."""
+        owns_doc = not isinstance(pdf, fitz.Document)
+        doc = open_pdf(pdf) if owns_doc else pdf
+        # Workers re-open the PDF, so parallelism needs a path or bytes (stream-opened docs have no name)
+        pdf_source = pdf if owns_doc else doc.name
+        # Font intern table for this call only; the extractor itself is shared across sessions
+        fonts = {}
+        if doc.page_count >= PARALLEL_MIN_PAGES and pdf_source and (os.cpu_count() or 1) > 1:
+            all_lines = self._get_lines_parallel(pdf_source, doc.page_count, fonts)
+        else:
+            all_lines = []
+            for page in doc:
+                all_lines.extend(self._get_lines_with_style(page, fonts))
+        if owns_doc:
+            doc.close()
 
         all_lines = self._merge_split_headers(all_lines)
 
         if not all_lines: return [], 0, 0
 
-        sizes = [round(l["size"], 1) for l in all_lines]
+        sizes = [l["size_r"] for l in all_lines]
         body_size = Counter(sizes).most_common(1)[0][0]
 
         detected_headers = []
-        final_headers = []
+        detected_records = []
+        seen_detected = set()
+        # Eligible lines bucketed by rounded size, each tagged with its position in document order
+        candidates_by_size = {}
+        position = 0
 
-        target_size = None
-        target_is_bold = None
-        target_is_upper = None
-        target_font_name = None
+        # Bind the lookup tables to locals; both passes below run once per line
+        header_set = self.HEADER_SET
+        spaceless_set = self.SPACELESS_SET
+        header_search = self.HEADER_RE.search
+        prominent_size = body_size + 1
 
-        while True:
-            for line in all_lines:
-                text = line["text"]
-                clean = line["clean"]
+        # Pass 1: score every eligible line once and remember a flat style record for Pass 2
+        for line in all_lines:
+            text = line["text"]
+            clean = line["clean"]
 
-                if line["is_bullet"]: continue
-                if len(clean.split()) > 10: continue 
+            if line["is_bullet"]: continue
+            if line["word_count"] > 10: continue 
 
-                score = 0
+            # --- Spaceless Check ---
+            spaceless_clean = line["spaceless"]
+            is_spaceless_header = spaceless_clean in spaceless_set
+            size, is_bold, is_upper = line["size"], line["is_bold"], line["is_upper"]
+            size_r = line["size_r"]
+            record = (line, size_r, is_bold, is_upper, line["font_id"], is_spaceless_header)
+            candidates_by_size.setdefault(size_r, []).append((position, record))
+            position += 1
 
-                # --- Spaceless Check ---
-                spaceless_clean = clean.replace(" ", "")
-                
-                # A. Exact Keyword Match (Standard OR Spaceless)
-                if clean in self.HEADER_PATTERNS:
-                    score += 3
-                elif spaceless_clean in self.SPACELESS_HEADERS:
-                    print(f"DEBUG: Detected spaced header '{text}' matching '{self.SPACELESS_HEADERS[spaceless_clean]}'")
-                    score += 3
-                
-                # B. Partial Keyword Match
-                elif any(h in clean for h in self.HEADER_PATTERNS):
-                    score += 1
-                else:
-                    if target_size is None and target_is_bold is None and target_is_upper is None:
-                        continue
+            score = 0
 
-                # C. Visual Prominence
-                if line["size"] > body_size + 1: score += 2
-                if line["is_bold"]: score += 1
-                if line["is_upper"]: score += 1
-
-                # 3. DECISION LOGIC
-                is_header = False
-                if score >= 3:
-                    is_header = True
-
-                # Pass 1 Logic
-                if target_size is None:
-                    if is_header and text not in [h["text"] for h in detected_headers]:
-                        # print("Detected Header (Pass 1):", text)
-                        detected_headers.append(line)
-                
-                # Pass 2 Logic
-                else:
-                    is_final_header = False
-                    size = round(line["size"], 1)
-                    
-                    if target_size is not None:
-                        size_match = abs(size - target_size) <= 0.5
-                        bold_match = (line["is_bold"] == target_is_bold)
-                        upper_match = (line["is_upper"] == target_is_upper)
-                        font_match = (line["font"] == target_font_name)
-
-                        if size_match and bold_match and upper_match and font_match:
-                            is_final_header = True
-                        
-                        elif spaceless_clean in self.SPACELESS_HEADERS:
-                             if size_match: is_final_header = True
-                        
-                        if is_final_header and text not in [h["text"] for h in final_headers]:
-                            print("Final Header Detected:", text)
-                            final_headers.append(line)
-
-            if final_headers:
-                avg_header_block_height = sum(h["block_height"] for h in final_headers) / len(final_headers)
-                return final_headers, body_size, avg_header_block_height
-
-            if detected_headers:
-                detected_sizes = [round(h["size"], 1) for h in detected_headers]
-                target_size = Counter(detected_sizes).most_common(1)[0][0]
-                target_is_bold = Counter([h["is_bold"] for h in detected_headers]).most_common(1)[0][0]
-                target_is_upper = Counter([h["is_upper"] for h in detected_headers]).most_common(1)[0][0]
-                target_font_name = Counter([h["font"] for h in detected_headers]).most_common(1)[0][0]
+            # A. Exact Keyword Match (Standard OR Spaceless)
+            if clean in header_set:
+                score += 3
+            elif is_spaceless_header:
+                logger.debug("Detected spaced header '%s' matching '%s'", text, self.SPACELESS_HEADERS[spaceless_clean])
+                score += 3
+            
+            # B. Partial Keyword Match
+            elif header_search(clean) is not None:
+                score += 1
             else:
-                break
-        
-        avg_header_block_height = sum(h["block_height"] for h in detected_headers) / len(detected_headers) if detected_headers else 0
-        return detected_headers, body_size, avg_header_block_height
\ No newline at end of file
+                continue
+
+            # C. Visual Prominence
+            if size > prominent_size: score += 2
+            if is_bold: score += 1
+            if is_upper: score += 1
+
+            # 3. DECISION LOGIC
+            if score >= 3 and text not in seen_detected:
+                # print("Detected Header (Pass 1):", text)
+                seen_detected.add(text)
+                detected_headers.append(line)
+                detected_records.append(record)
+
+        if not detected_headers:
+            return detected_headers, body_size, 0
+
+        # Bootstrap the dominant header style from the Pass 1 records (one column per attribute)
+        _, sizes, bolds, uppers, font_ids, _ = zip(*detected_records)
+        target_size = _most_common(sizes)
+        target_is_bold = _most_common(bolds)
+        target_is_upper = _most_common(uppers)
+        target_font_id = _most_common(font_ids)
+
+        # Pass 2: size has to match in both acceptance branches, so only the size buckets
+        # within 0.5pt of the target are visited; the body-text bucket is skipped wholesale
+        matching = [entry for bucket_size, bucket in candidates_by_size.items()
+                    if abs(bucket_size - target_size) <= 0.5 for entry in bucket]
+        matching.sort(key=itemgetter(0))  # Back to document order across buckets
+
+        final_headers = []
+        seen_final = set()
+        for _, (line, size, is_bold, is_upper, font_id, is_spaceless_header) in matching:
+            style_match = is_bold == target_is_bold and is_upper == target_is_upper and font_id == target_font_id
+            if not (style_match or is_spaceless_header): continue
+
+            text = line["text"]
+            if text not in seen_final:
+                logger.debug("Final Header Detected: %s", text)
+                seen_final.add(text)
+                final_headers.append(line)
+
+        # Fall back to the Pass 1 headers if no line matched the bootstrapped style
+        result_headers = final_headers or detected_headers
+        avg_header_block_height = sum(h["block_height"] for h in result_headers) / len(result_headers)
+        return result_headers, body_size, avg_header_block_height
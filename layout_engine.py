@@ -1,280 +1,442 @@
-from pydoc import doc
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
+import numpy as np
 import pymupdf as fitz
-def draw_section_boundaries(page, column_blocks, headers, color):
+
+from header_extractor import PARALLEL_MIN_PAGES, TEXT_FLAGS, open_pdf, page_chunks
+
+try:
+    from numba import njit
+except ImportError:  # Numba is optional; without it the split search runs as plain Python
+    njit = None
+
+# Compressed streams and unused objects dropped keep the debug report small
+SAVE_OPTIONS = dict(garbage=3, deflate=True, deflate_images=True, clean=True)
+
+
+def _tag_heading_blocks(text_blocks, headings):
     """
-    Groups blocks into sections based on headers and draws a box around the entire group.
+    Caches each block's stripped text and its heading checks, so the passes below test
+    flags instead of rescanning every heading against every block.
+    """
+    heading_texts = {h["text"] for h in headings}
+    heading_lowers = [h["text"].lower() for h in headings]
+
+    for i, b in enumerate(text_blocks):
+        b["_idx"] = i  # Row of this block in the bbox arrays
+        stripped = b["full_text"].strip()
+        lower = stripped.lower()
+        b["_stripped"] = stripped
+        b["_lower"] = lower
+        b["_is_heading"] = stripped in heading_texts                        # Block is exactly a heading
+        b["_has_heading"] = any(h["text"] in stripped for h in headings)    # Block contains a heading
+        b["_has_heading_ci"] = any(h in lower for h in heading_lowers)      # ...ignoring case
+
+
+def _split_kernel(x0, y0, x1, y1, min_col_width):
     """
-    if not column_blocks:
+    Sweep-line over the blocks' y-intervals: each block is only tested against the earlier
+    wide blocks still open at its top edge, rather than against every later block. Plain
+    scalar loops, so it runs both compiled by Numba (over arrays) and as ordinary Python
+    (over lists). Returns the index of the pair's first block, or -1.
+    """
+    n = len(y0)
+    active = [0] * n  # Wide blocks whose bottom is below the sweep line, in order
+    n_active = 0
+    best = -1
+
+    for j in range(n):
+        # Drop blocks that ended above this top edge (and, once a pair is known, later ones)
+        k = 0
+        for a in range(n_active):
+            i = active[a]
+            if y1[i] > y0[j] and (best < 0 or i < best):
+                active[k] = i
+                k += 1
+        n_active = k
+        if best >= 0 and n_active == 0: break
+        if x1[j] - x0[j] < min_col_width: continue
+
+        for a in range(n_active):
+            i = active[a]
+            if y1[j] > y0[i] and (x1[i] < x0[j] or x1[j] < x0[i]):
+                best = i
+                break
+        if best < 0:
+            active[n_active] = j
+            n_active += 1
+
+    return best
+
+
+# Compiled once per install (cache=True keeps the machine code between runs)
+_split_kernel_jit = njit(cache=True)(_split_kernel) if njit is not None else None
+
+
+def _find_split_y(x0, y0, x1, y1, min_col_width):
+    """
+    Returns the top of the first pair of y-overlapping, x-separated blocks (both at least
+    'min_col_width' wide), or None. Takes the blocks' bbox columns, sorted by top edge.
+    """
+    if _split_kernel_jit is not None:
+        best = _split_kernel_jit(x0, y0, x1, y1, min_col_width)
+    else:
+        # Python floats index far faster than NumPy scalars in the scalar loops
+        best = _split_kernel(x0.tolist(), y0.tolist(), x1.tolist(), y1.tolist(), min_col_width)
+    return float(y0[best]) if best >= 0 else None
+
+
+def _extract_blocks(page):
+    """Returns the page's text blocks, each with its "full_text" and "_min_font", sorted by top edge."""
+    raw_dict = page.get_text("dict", flags=TEXT_FLAGS)
+    text_blocks = []
+
+    for b in raw_dict["blocks"]:
+        if b["type"] != 0: continue
+        # Each span followed by a space, each line by a newline; built with joins, not '+='
+        b["full_text"] = "".join("".join(span["text"] + " " for span in line["spans"]) + "\n" for line in b["lines"])
+        # Smallest font in the block, for the small-font heuristic; the span payload isn't needed after this
+        b["_min_font"] = min((span["size"] for line in b["lines"] for span in line["spans"]), default=float("inf"))
+        del b["lines"]
+        text_blocks.append(b)
+
+    text_blocks.sort(key=lambda b: b["bbox"][1])
+    return text_blocks
+
+
+def _stroke_rects(shape, rects, color, width):
+    """Adds 'rects' to 'shape' as one stroked group, so they share a single graphics-state setup."""
+    if not rects:
         return
+    for rect in rects:
+        shape.draw_rect(rect)
+    shape.finish(color=color, width=width)
 
-    current_section_group = []
 
-    for b in column_blocks:
+def draw_section_boundaries(shape, text_blocks, bboxes, column_idx, color):
+    """
+    Groups a column's blocks into sections based on headers and draws a box around each group.
+    A column without any header block has no sections, so nothing is drawn for it.
+    'column_idx' lists the column's rows of 'bboxes' (the (N, 4) bbox array of 'text_blocks',
+    tagged by _tag_heading_blocks) in reading order; drawing goes onto 'shape'.
+    """
+    if not len(column_idx):
+        return
 
-        is_header = any(header["text"].lower() in b["full_text"].strip().lower() for header in headers)
+    # A section starts at the column's first block and at every header block after it
+    is_header = np.array([text_blocks[i]["_has_heading_ci"] for i in column_idx], dtype=bool)
+    if not is_header.any():
+        return
+    is_header[0] = True
+    starts = np.flatnonzero(is_header)
 
-        if is_header:
-            if current_section_group:
-                # Calculate the "Union" rectangle of all blocks in the group
-                union_rect = fitz.Rect(current_section_group[0]["bbox"])
-                for block in current_section_group[1:]:
-                    union_rect |= fitz.Rect(block["bbox"]) # '|' is the union operator in PyMuPDF
-                    union_rect += (1,1,1,1)  # Slightly expand the rectangle for better visibility
+    # Union rectangle of each section: edge-wise min/max reduced over its slice of the column
+    col_bb = bboxes[column_idx]
+    union_x0 = np.minimum.reduceat(col_bb[:, 0], starts)
+    union_y0 = np.minimum.reduceat(col_bb[:, 1], starts)
+    union_x1 = np.maximum.reduceat(col_bb[:, 2], starts)
+    union_y1 = np.maximum.reduceat(col_bb[:, 3], starts)
 
-                page.draw_rect(union_rect, color=color, width=1.5)
-                page.insert_text((union_rect.x0, union_rect.y0 - 2), f"Section: {current_section_group[0]['full_text'].strip().lower()}", color=color, fontsize=6)
-            
-            # Start a NEW section with this header block
-            current_section_group = [b]
-        else:
-            # It's body text; add it to the currently running section
-            current_section_group.append(b)
-
-    # LAST section after the loop finishes
-    if current_section_group:
-        union_rect = fitz.Rect(current_section_group[0]["bbox"])
-        for block in current_section_group[1:]:
-            union_rect |= fitz.Rect(block["bbox"])
-        page.draw_rect(union_rect, color=color, width=1.5)
-        page.insert_text((union_rect.x0, union_rect.y0 - 2), f"Section: {current_section_group[0]['full_text'].strip().lower()}", color=color, fontsize=6)
-
-
-def generate_layout_debug_pdf(doc_path, headings, body_size, avg_header_block_height):
+    rects = [fitz.Rect(*edges) + (-1, -1, 1, 1)  # Slightly expand the rectangle for better visibility
+             for edges in zip(union_x0.tolist(), union_y0.tolist(), union_x1.tolist(), union_y1.tolist())]
+    _stroke_rects(shape, rects, color, 1.5)
+    for rect, start in zip(rects, starts.tolist()):
+        shape.insert_text((rect.x0, rect.y0 - 2), f"Section: {text_blocks[column_idx[start]]['_lower']}", color=color, fontsize=6)
+
+
+def _classify_blocks(text_blocks, above_split, small_font_size):
     """
-    Analyzes the layout of the first page of the PDF at 'doc_path'.
-    Applies geometric logic to detect columns, headers, and body text.
-    
-    Returns:
-        bytes: The binary data of the generated Debug PDF (for download/display).
+    Splits the page's blocks into header blocks (Name/Title) and body blocks. Everything the
+    loop reads is passed in, so the per-block tests only touch fast locals.
+    """
+    header_blocks = []
+    body_blocks = []
+    prev_was_body = False
+
+    for i, b in enumerate(text_blocks):
+        if above_split[i]:
+            # Heuristics: heading text, previous block was body (this might be body too),
+            # or a small font all mean body; anything else is likely Name/Title
+            if not (b["_has_heading"] or prev_was_body or b["_min_font"] <= small_font_size):
+                header_blocks.append(b)
+                prev_was_body = False
+                continue
+
+        body_blocks.append(b)
+        prev_was_body = True
+
+    return header_blocks, body_blocks
+
+
+def _annotate_page(page, headings, body_size, avg_header_block_height):
     """
+    Draws the layout analysis (columns, headers, body text, sections) onto 'page'.
+    Returns False, leaving the page untouched, if it has no text.
+    """
+    # page.rect builds a new Rect on every access, so read the size once
+    page_width, page_height = page.rect.width, page.rect.height
+
+    # Colors (R, G, B)
+    COLOR_HEADER = (1, 0, 0)      # Red
+    COLOR_LEFT   = (0, 0, 1)      # Blue
+    COLOR_RIGHT  = (0, 0.5, 0)    # Green
+    COLOR_BODY   = (1, 0.5, 0)    # Orange
+    COLOR_SPLIT  = (1, 0, 1)      # Magenta
+    COLOR_HEADING = (0.5, 0, 0.5)  # Purple
+    COLOR_SECTION_BOX = (0, 0.8, 0.8) # Cyan
+    text_blocks = _extract_blocks(page)
+
+    if not text_blocks:
+        print("No text found to debug.")
+        return False
+
+    _tag_heading_blocks(text_blocks, headings)
+
+    # Bbox columns (SoA), indexed by each block's "_idx"; geometry below reads these
+    bboxes = np.array([b["bbox"] for b in text_blocks], dtype=np.float64)
+    x0, y0, x1, y1 = bboxes.T
+
+    def by_top(blocks):
+        """Returns 'blocks' stably sorted by top edge."""
+        idx = np.array([b["_idx"] for b in blocks], dtype=np.intp)
+        return [text_blocks[i] for i in idx[np.argsort(y0[idx], kind="stable")]]
     
-    # Open the document
-    with fitz.open(doc_path) as doc:
-        page = doc[0]  # Working on the first page
-
-        # Colors (R, G, B)
-        COLOR_HEADER = (1, 0, 0)      # Red
-        COLOR_LEFT   = (0, 0, 1)      # Blue
-        COLOR_RIGHT  = (0, 0.5, 0)    # Green
-        COLOR_BODY   = (1, 0.5, 0)    # Orange
-        COLOR_SPLIT  = (1, 0, 1)      # Magenta
-        COLOR_HEADING = (0.5, 0, 0.5)  # Purple
-        COLOR_SECTION_BOX = (0, 0.8, 0.8) # Cyan
-        raw_dict = page.get_text("dict")
-        text_blocks = []
-
-        for b in raw_dict["blocks"]:
-            if b["type"] != 0: continue
-            block_text = ""
-            for line in b["lines"]:
-                for span in line["spans"]:
-                    block_text += span["text"] + " "
-                block_text += "\n"
-            b["full_text"] = block_text
-            text_blocks.append(b)
-
-        if not text_blocks:
-            print("No text found to debug.")
-            return
+    # Space below each heading block (from the second block on) down to the next block;
+    # a heading in the last block has no successor and is skipped
+    has_heading = np.array([b["_has_heading"] for b in text_blocks[:-1]], dtype=bool)
+    has_heading[:1] = False
+    header_gaps = (y0[1:] - y1[:-1])[has_heading].tolist()
+    avg_header_gap = sum(header_gaps) / len(header_gaps) if header_gaps else 0
+    print(f"Avg Header Gap (Debug): {avg_header_gap}")
+
+    # --- Find Split Logic (Copied from your function) ---
+    min_col_width = page_width * 0.05
+    
+    found_split_y = _find_split_y(x0, y0, x1, y1, min_col_width)
 
-        text_blocks.sort(key=lambda b: b["bbox"][1])
-        
-        header_gaps = []
-        for i in range(1, len(text_blocks)):
-            if any(header["text"] in text_blocks[i]["full_text"].strip() for header in headings):
-                gap = text_blocks[i+1]["bbox"][1] - text_blocks[i]["bbox"][3]
-                header_gaps.append(gap)
-        avg_header_gap = sum(header_gaps) / len(header_gaps) if header_gaps else 0
-        print(f"Avg Header Gap (Debug): {avg_header_gap}")
-
-        # --- Find Split Logic (Copied from your function) ---
-        found_split_y = None
-        min_col_width = page.rect.width * 0.05
+    # =========================================================================
+    
+    # All annotations go onto one shape, stroked per color group and committed once
+    shape = page.new_shape()
+
+    # 1. Draw Single Column (if no split found)
+    if found_split_y is None:
+        print("Debug: No split found - marking all as Body.")
+        _stroke_rects(shape, [b["bbox"] for b in text_blocks], COLOR_BODY, 1.5)
+        for b in text_blocks:
+            shape.insert_text((b["bbox"][0], b["bbox"][1]-2), "Body", color=COLOR_BODY, fontsize=8)
+
+    # 2. Draw Two Column Layout
+    else:
+        print(f"Debug: Split found at {found_split_y}")
+        split_threshold = found_split_y - 5
         
-        for i, b1 in enumerate(text_blocks):
-            if found_split_y is not None: break
-            y1_top, y1_bottom = b1["bbox"][1], b1["bbox"][3]
-            b1_width = b1["bbox"][2] - b1["bbox"][0]
-            if b1_width < min_col_width: continue
-
-            for b2 in text_blocks[i+1:]:
-                y2_top = b2["bbox"][1]
-                y2_bottom = b2["bbox"][3]
-                if y2_top >= y1_bottom: break
-                b2_width = b2["bbox"][2] - b2["bbox"][0]
-                if b2_width < min_col_width: continue
-
-                vertical_overlap = (y2_top < y1_bottom) and (y2_bottom > y1_top)
-                horizontal_separation = (b1["bbox"][2] < b2["bbox"][0]) or (b2["bbox"][2] < b1["bbox"][0])
-                
-                if vertical_overlap and horizontal_separation:
-                    found_split_y = min(y1_top, y2_top)
-                    break
-
-        # =========================================================================
+        # Check if block is above split threshold OR straddles it: both reduce to its top
+        # starting above the threshold (they differ only for a zero-height block lying on it)
+        above_split = (y0 < split_threshold).tolist()
+
+        # --- Initial Classification ---
+        header_blocks, body_blocks = _classify_blocks(text_blocks, above_split, body_size + 2)
         
-        # 1. Draw Single Column (if no split found)
-        if found_split_y is None:
-            print("Debug: No split found - marking all as Body.")
-            for b in text_blocks:
-                page.draw_rect(b["bbox"], color=COLOR_BODY, width=1.5)
-                page.insert_text((b["bbox"][0], b["bbox"][1]-2), "Body", color=COLOR_BODY, fontsize=8)
-
-        # 2. Draw Two Column Layout
-        else:
-            print(f"Debug: Split found at {found_split_y}")
-            split_threshold = found_split_y - 5
+        # 3b. Process Header
+        header_blocks = by_top(header_blocks)
+
+        # -- Calculate Dynamic Center --
+        dynamic_center = 0
+        left_col = []
+        right_col = []
+
+        if body_blocks:
+            body_idx = np.array([b["_idx"] for b in body_blocks], dtype=np.intp)
+            body_x0 = x0[body_idx]
+            dynamic_center = sum(body_x0.tolist()) / len(body_x0)
             
-            header_blocks = []
-            body_blocks = []
-
-            # --- Initial Classification ---
-            for i in range(len(text_blocks)):
-                # Check if block is above split threshold OR straddles it significantly
-                is_above_split = (text_blocks[i]["bbox"][3] <= split_threshold) or \
-                                (text_blocks[i]["bbox"][1] < split_threshold and text_blocks[i]["bbox"][3] > split_threshold)
-                
-                if is_above_split:
-                    is_heading_text = any(heading["text"] in text_blocks[i]["full_text"].strip() for heading in headings)
-                    # Heuristic: If previous block was body, this might be body too
-                    prev_was_body = (text_blocks[i-1] in body_blocks) if i > 0 else False
-                    # Heuristic: Font size check
-                    small_font = any(s["size"] <= body_size+2 for line in text_blocks[i]["lines"] for s in line["spans"])
-
-                    if is_heading_text:
-                        body_blocks.append(text_blocks[i]) 
-                        pass 
-                    elif prev_was_body:
-                        body_blocks.append(text_blocks[i])
-                    elif small_font:
-                        body_blocks.append(text_blocks[i])
-                    else:
-                        header_blocks.append(text_blocks[i]) # This is likely Name/Title
-                else:
-                    body_blocks.append(text_blocks[i])
+            # Initial Geometric Split, each column sorted internally by Y
+            left_mask = body_x0 < dynamic_center
+            for col, col_idx in ((left_col, body_idx[left_mask]), (right_col, body_idx[~left_mask])):
+                col.extend(text_blocks[i] for i in col_idx[np.argsort(y0[col_idx], kind="stable")])
+
+            # 1. Left to Right: Collect items to move until a header is found
+            to_move_to_right = []
+            for b in left_col:
+                if b["_has_heading"]:
+                    break 
+                # Your specific condition from the updated code
+                if not above_split[b["_idx"]]:
+                    to_move_to_right.append(b)
             
-            # 3b. Process Header
-            header_blocks.sort(key=lambda b: b["bbox"][1])
-            header_text = "\n".join([b["full_text"].strip() for b in header_blocks])
-
-            # -- Calculate Dynamic Center --
-            dynamic_center = 0
-            left_col = []
-            right_col = []
-
-            if body_blocks:
-                body_x0_values = [b["bbox"][0] for b in body_blocks]
-                dynamic_center = sum(body_x0_values) / len(body_x0_values)
-                
-                # Initial Geometric Split
-                for b in body_blocks:
-                    if b["bbox"][0] < dynamic_center:
-                        left_col.append(b)
-                    else:
-                        right_col.append(b)
-
-                # Sort columns internally by Y
-                left_col.sort(key=lambda b: (b["bbox"][1]))
-                right_col.sort(key=lambda b: (b["bbox"][1]))
-
-                # 1. Left to Right: Collect items to move until a header is found
-                to_move_to_right = []
-                for b in left_col:
-                    if any(header["text"] in b["full_text"].strip() for header in headings):
-                        break 
-                    # Your specific condition from the updated code
-                    if not (b["bbox"][3] <= split_threshold or b["bbox"][1] < split_threshold and b["bbox"][3] > split_threshold):
-                        to_move_to_right.append(b)
-                
-                for b in to_move_to_right:
-                    if b in left_col: left_col.remove(b)
-                    right_col.append(b) 
-
-                # Right to Left: Collect items to move until a header is found
+            moved = {b["_idx"] for b in to_move_to_right}
+            left_col = [b for b in left_col if b["_idx"] not in moved]
+            right_col.extend(to_move_to_right)
+
+            # Right to Left: Collect items to move until a header is found
+            to_move_to_left = []
+            # Headings met so far that sit right of the center, as (bottom, left) pairs;
+            # a block stays right only if one of them is above it and roughly aligned
+            right_headings = []
+            
+            for normal_block in right_col:
+                nx0, ny0 = normal_block["bbox"][0], normal_block["bbox"][1]
+                if normal_block["_is_heading"]:
+                    if nx0 >= dynamic_center:
+                        right_headings.append((normal_block["bbox"][3], nx0))
+                    continue
+                if not any(hy1 < ny0 and hx0 <= (nx0 + 10) for hy1, hx0 in right_headings):
+                    to_move_to_left.append(normal_block)
+
+            moved = {b["_idx"] for b in to_move_to_left}
+            right_col = [b for b in right_col if b["_idx"] not in moved]
+            left_col.extend(to_move_to_left)
+
+            # Sort columns internally
+            left_col = by_top(left_col)
+            right_col = by_top(right_col)
+            
+            if avg_header_block_height > 0 and avg_header_gap > 0:
+                print(avg_header_block_height + avg_header_gap)
+                # gaps[i]: vertical space between right_col[i] and right_col[i+1]
+                right_idx = np.array([b["_idx"] for b in right_col], dtype=np.intp)
+                gaps = (y0[right_idx[1:]] - y1[right_idx[:-1]]).tolist()
+                gap_found = False
                 to_move_to_left = []
-                
-                for i in range(len(right_col)):
+                for i in range(len(right_col)-1):
                     normal_block = right_col[i]
-                    if any(header["text"] == normal_block["full_text"].strip() for header in headings):
+                    if normal_block["_has_heading"]:
+                        gap_found = False
                         continue
-                    else:
-                        found_header = False
-                        for j in range(i):
-                            if any(header["text"] == right_col[j]["full_text"].strip() for header in headings):
-                                header_block = right_col[j]
-                                if header_block["bbox"][3] < normal_block["bbox"][1] and header_block["bbox"][0] <= (normal_block["bbox"][0] + 10) and header_block["bbox"][0] >= dynamic_center:
-                                    found_header = True
-                                    break
-                        if not found_header and normal_block not in to_move_to_left:
-                            to_move_to_left.append(normal_block)
-
-                for b in to_move_to_left:
-                    if b in right_col: right_col.remove(b)
-                    left_col.append(b)
-
-                # Sort columns internally
-                left_col.sort(key=lambda b: (b["bbox"][1]))
-                right_col.sort(key=lambda b: (b["bbox"][1]))
-                
-                if avg_header_block_height > 0 and avg_header_gap > 0:
-                    print(avg_header_block_height + avg_header_gap)
-                    gap_found = False
-                    to_move_to_left = []
-                    for i in range(len(right_col)-1):
-                        normal_block = right_col[i]
-                        if any(header["text"] in normal_block["full_text"].strip() for header in headings):
-                            gap_found = False
-                            continue
-                        if i < len(right_col) - 1:
-                            if right_col[i+1]["bbox"][1] - normal_block["bbox"][3] >= (avg_header_gap + avg_header_block_height + 5) and not gap_found and not any(header["text"] in right_col[i+1]["full_text"].strip() for header in headings):
-                                print("Gap Found (Debug)", right_col[i+1]["bbox"][1] - normal_block["bbox"][3])
-                                print("after this text:", normal_block["full_text"].strip())
-                                gap_found = True
-                        if gap_found:
-                            to_move_to_left.append(right_col[i+1])
-                    for b in to_move_to_left:
-                        if b in right_col: right_col.remove(b)
-                        left_col.append(b)
-
-            # -- DRAWING COMMANDS --
-
-            # A. Draw Header Blocks
-            for b in header_blocks:
-                page.draw_rect(b["bbox"], color=COLOR_HEADER, width=2)
-                page.insert_text((b["bbox"][0], b["bbox"][1]-5), "HEADER", color=COLOR_HEADER, fontsize=10)      
-
-            # B. Draw Left Column (Blue) - iterate the LIST, not geometry
-            for b in left_col:
-                if b["full_text"].strip() in [h["text"] for h in headings]:
-                    page.draw_rect(b["bbox"], color=COLOR_HEADING, width=1.5)
-                    page.insert_text((b["bbox"][0], b["bbox"][3]+5), "Header || Left", color=COLOR_HEADING, fontsize=6)
-                else:
-                    page.draw_rect(b["bbox"], color=COLOR_LEFT, width=1.5)
-                    page.insert_text((b["bbox"][0], b["bbox"][1]-2), "Left", color=COLOR_LEFT, fontsize=6)
-
-            # C. Draw Right Column (Green) - iterate the LIST, not geometry
-            for b in right_col:
-                if b["full_text"].strip() in [h["text"] for h in headings]:
-                    page.draw_rect(b["bbox"], color=COLOR_HEADING, width=1.5)
-                    page.insert_text((b["bbox"][0], b["bbox"][3]+5), "Header || Right", color=COLOR_HEADING, fontsize=6)
+                    if i < len(right_col) - 1:
+                        if gaps[i] >= (avg_header_gap + avg_header_block_height + 5) and not gap_found and not right_col[i+1]["_has_heading"]:
+                            print("Gap Found (Debug)", gaps[i])
+                            print("after this text:", normal_block["_stripped"])
+                            gap_found = True
+                    if gap_found:
+                        to_move_to_left.append(right_col[i+1])
+                moved = {b["_idx"] for b in to_move_to_left}
+                right_col = [b for b in right_col if b["_idx"] not in moved]
+                left_col.extend(to_move_to_left)
+
+        # -- DRAWING COMMANDS --
+
+        # A. Draw Header Blocks
+        _stroke_rects(shape, [b["bbox"] for b in header_blocks], COLOR_HEADER, 2)
+        for b in header_blocks:
+            shape.insert_text((b["bbox"][0], b["bbox"][1]-5), "HEADER", color=COLOR_HEADER, fontsize=10)      
+
+        # B./C. Draw Left (Blue) and Right (Green) Columns - iterate the LIST, not geometry
+        heading_rects = []
+        for col, label, color in ((left_col, "Left", COLOR_LEFT), (right_col, "Right", COLOR_RIGHT)):
+            col_rects = []
+            for b in col:
+                if b["_is_heading"]:
+                    heading_rects.append(b["bbox"])
+                    shape.insert_text((b["bbox"][0], b["bbox"][3]+5), f"Header || {label}", color=COLOR_HEADING, fontsize=6)
                 else:
-                    page.draw_rect(b["bbox"], color=COLOR_RIGHT, width=1.5)
-                    page.insert_text((b["bbox"][0], b["bbox"][1]-2), "Right", color=COLOR_RIGHT, fontsize=6)
+                    col_rects.append(b["bbox"])
+                    shape.insert_text((b["bbox"][0], b["bbox"][1]-2), label, color=color, fontsize=6)
+            _stroke_rects(shape, col_rects, color, 1.5)
+        _stroke_rects(shape, heading_rects, COLOR_HEADING, 1.5)
 
-            # D. Draw Split Threshold Line
-            page.draw_line((0, split_threshold), (page.rect.width, split_threshold), color=COLOR_SPLIT, width=2)
-            page.insert_text((5, split_threshold - 5), f"Split Threshold: {split_threshold:.1f}", color=COLOR_SPLIT)
+        # D. Draw Split Threshold Line
+        shape.draw_line((0, split_threshold), (page_width, split_threshold))
+        shape.finish(color=COLOR_SPLIT, width=2, closePath=False)
+        shape.insert_text((5, split_threshold - 5), f"Split Threshold: {split_threshold:.1f}", color=COLOR_SPLIT)
 
-            # E. Draw Dynamic Center Line
-            if body_blocks:
-                page.draw_line((dynamic_center, split_threshold), (dynamic_center, page.rect.height), color=COLOR_LEFT, width=2)
-                page.insert_text((dynamic_center + 5, split_threshold + 20), "Dynamic Center", color=COLOR_LEFT, fontsize=8)
+        # E. Draw Dynamic Center Line
+        if body_blocks:
+            shape.draw_line((dynamic_center, split_threshold), (dynamic_center, page_height))
+            shape.finish(color=COLOR_LEFT, width=2, closePath=False)
+            shape.insert_text((dynamic_center + 5, split_threshold + 20), "Dynamic Center", color=COLOR_LEFT, fontsize=8)
 
-            # F. Draw Section Boundaries for Left Column
-            draw_section_boundaries(page, left_col, headings, COLOR_SECTION_BOX)
-            # G. Draw Section Boundaries for Right Column
-            draw_section_boundaries(page, right_col, headings, COLOR_SECTION_BOX)
+        # F. Draw Section Boundaries for Left Column
+        draw_section_boundaries(shape, text_blocks, bboxes, [b["_idx"] for b in left_col], COLOR_SECTION_BOX)
+        # G. Draw Section Boundaries for Right Column
+        draw_section_boundaries(shape, text_blocks, bboxes, [b["_idx"] for b in right_col], COLOR_SECTION_BOX)
+
+    shape.commit()
+
+    return True
+
+
+def _open_source(doc_source):
+    """
+    Opens 'doc_source' (a file path or the PDF's bytes, read from memory so callers need no
+    temp file). A caller's open fitz.Document, or the document of a fitz.Page, is borrowed:
+    the returned context manager yields it without closing it on exit.
+    """
+    if isinstance(doc_source, fitz.Page):
+        return nullcontext(doc_source.parent)
+    if isinstance(doc_source, fitz.Document):
+        return nullcontext(doc_source)
+    return open_pdf(doc_source)
+
+
+def generate_layout_debug_pdf(doc_source, headings, body_size, avg_header_block_height):
+    """
+    Analyzes the layout of the first page of 'doc_source' (a file path, the PDF's bytes,
+    or an already-open fitz.Document, which is drawn on in place and left open). An open
+    fitz.Page can be passed instead to analyze (and draw on) that page of its document.
+    Applies geometric logic to detect columns, headers, and body text.
+    
+    Returns:
+        bytes: The binary data of the generated Debug PDF (for download/display).
+    """
+    with _open_source(doc_source) as doc:
+        # Working on the first page, unless the caller handed over a specific one
+        page = doc_source if isinstance(doc_source, fitz.Page) else doc[0]
+        if not _annotate_page(page, headings, body_size, avg_header_block_height):
+            return
 
         # Save to bytes
-        pdf_bytes = doc.write()
-        return pdf_bytes
\ No newline at end of file
+        pdf_bytes = doc.tobytes(**SAVE_OPTIONS)
+        return pdf_bytes
+
+
+def _annotate_page_range(doc_source, page_numbers, headings, body_size, avg_header_block_height):
+    """
+    Annotates 'page_numbers' of 'doc_source' and returns just those pages, in that order, as
+    PDF bytes. Also the worker entry point of generate_layout_debug_pages.
+    """
+    with _open_source(doc_source) as doc, fitz.open() as report:
+        for i in page_numbers:
+            _annotate_page(doc[i], headings, body_size, avg_header_block_height)
+            report.insert_pdf(doc, from_page=i, to_page=i)
+        return report.tobytes(**SAVE_OPTIONS)
+
+
+def generate_layout_debug_pages(doc_source, headings, body_size, avg_header_block_height, page_indices=None):
+    """
+    Multi-page form of generate_layout_debug_pdf: annotates every page in 'page_indices'
+    (default: all pages) and returns one Debug PDF holding those pages in order, or None
+    when there are no pages to annotate. Pages without text are included as they are.
+    Raises ValueError if a page number is outside the document.
+
+    Long page lists from a file path or PDF bytes are split into contiguous chunks and
+    annotated in worker processes; an open document is annotated in place, in this process.
+    """
+    with _open_source(doc_source) as doc:
+        if page_indices is None:
+            page_indices = range(doc.page_count)
+        page_indices = list(page_indices)
+        if not page_indices:
+            return None
+        # Checked here, so a bad number fails clearly rather than inside MuPDF or a worker
+        bad_pages = [i for i in page_indices if not 0 <= i < doc.page_count]
+        if bad_pages:
+            raise ValueError(f"page_indices out of range for a {doc.page_count}-page document: {bad_pages}")
+
+        chunks = page_chunks(page_indices)
+        # Workers re-open the PDF, so parallelism needs a path or bytes rather than an open document
+        reopenable = not isinstance(doc_source, (fitz.Document, fitz.Page))
+        if len(page_indices) < PARALLEL_MIN_PAGES or len(chunks) < 2 or not reopenable:
+            return _annotate_page_range(doc, page_indices, headings, body_size, avg_header_block_height)
+
+    n = len(chunks)
+    with ProcessPoolExecutor(max_workers=n) as ex:
+        parts = list(ex.map(_annotate_page_range, [doc_source] * n, chunks,
+                            [headings] * n, [body_size] * n, [avg_header_block_height] * n))
+
+    with fitz.open() as report:
+        for part in parts:
+            with fitz.open(stream=part, filetype="pdf") as part_doc:
+                report.insert_pdf(part_doc)
+        return report.tobytes(**SAVE_OPTIONS)